@@ -241,8 +241,10 @@ def xcorr_pick_family(family, stream, shift_len=0.2, min_cc=0.4,
     # Correlation function needs a list of streams, we need to maintain order.
     ccc, chans = _concatenate_and_correlate(
         streams=detect_streams, template=family.template.st, cores=cores)
+    # Reversed so that the first detection is used for repeated ids
+    detections = {d.id: d for d in reversed(family.detections)}
     for i, detection_id in enumerate(detection_ids):
-        detection = [d for d in family.detections if d.id == detection_id][0]
+        detection = detections[detection_id]
         correlations = ccc[i]
         picked_chans = chans[i]
         detect_stream = detect_streams_dict[detection_id]
@@ -154,10 +154,14 @@ class Detection(object):
 
     def __hash__(self):
         """
-        Cannot hash Detection objects, they may change.
-        :return: 0
+        Hash of the template name and detection value.
+
+        Equal detections have equal hashes. The detection time is left out
+        because UTCDateTime objects of different precision can compare
+        equal. Detections may change, so the hash is only valid for as long
+        as the detection is not altered.
         """
-        return 0
+        return hash((self.template_name, self.detect_val))
 
     def __ne__(self, other):
         return not self.__eq__(other)
@@ -452,7 +456,7 @@ def read_detections(fname, encoding="UTF8"):
         detection = line.rstrip().split('; ')
         detection[1] = UTCDateTime(detection[1])
         detection[2] = int(float(detection[2]))
-        detection[3] = ast.literal_eval(detection[3])
+        detection[3] = _parse_chans(detection[3])
         detection[4] = float(detection[4])
         detection[5] = float(detection[5])
         if len(detection) < 9:
@@ -468,6 +472,41 @@ def read_detections(fname, encoding="UTF8"):
     return detections
 
 
+def _parse_chans(chans):
+    """
+    Parse the string representation of a list of channels.
+
+    Lists of tuples of strings are parsed directly, anything else falls back
+    to `ast.literal_eval`.
+
+    :type chans: str
+    :param chans: String representation of a list of channel tuples.
+
+    :rtype: list
+
+    .. rubric:: Example
+
+    >>> _parse_chans("[('PAG', 'EHZ'), ('PCA', 'EHZ')]")
+    [('PAG', 'EHZ'), ('PCA', 'EHZ')]
+    >>> _parse_chans("[]")
+    []
+    >>> _parse_chans("[None]")
+    [None]
+    """
+    chans = chans.strip()
+    if chans == '[]':
+        return []
+    if not (chans.startswith("[('") and chans.endswith("')]")):
+        return ast.literal_eval(chans)
+    parsed = []
+    for stachan in chans[3:-3].split("'), ('"):
+        stachan = stachan.split("', '")
+        if any(c in part for part in stachan for c in "'\"\\"):
+            return ast.literal_eval(chans)
+        parsed.append(tuple(stachan))
+    return parsed
+
+
 def write_catalog(detections, fname, format="QUAKEML"):
     """Write events contained within detections to a catalog file.
 
@@ -11,24 +11,30 @@ with data and output the detections.
     GNU Lesser General Public License, Version 3
     (https://www.gnu.org/copyleft/lesser.html)
 """
-import ast
 import copy
+import csv
+import io
 import os
 import shutil
 import logging
 
+import numpy as np
 from obspy import UTCDateTime, Stream
 from obspy.core.event import (
     StationMagnitude, Magnitude, ResourceIdentifier, WaveformStreamID,
     CreationInfo, StationMagnitudeContribution)
 
 from eqcorrscan.core.match_filter.matched_filter import _group_process
-from eqcorrscan.core.match_filter.detection import Detection, get_catalog
+from eqcorrscan.core.match_filter.detection import (
+    Detection, get_catalog, _parse_chans)
 from eqcorrscan.utils.plotting import cumulative_detections
 from eqcorrscan.utils.mag_calc import relative_magnitude
 
 Logger = logging.getLogger(__name__)
 
+# dtypes for the numeric attributes of detections when held in arrays
+_DETECTION_DTYPES = {'detect_time': np.float64, 'detect_val': np.float32}
+
 
 class Family(object):
     """
@@ -49,14 +55,16 @@ class Family(object):
         if isinstance(detections, Detection):
             detections = [detections]
         self.detections = detections or []
-        self.__catalog = get_catalog(self.detections)
+        # Catalog is generated when first needed
+        self.__catalog = None
         if catalog:
             Logger.warning("Setting catalog directly is no-longer supported, "
                            "now generated from detections.")
 
     @property
     def catalog(self):
-        if len(self.__catalog) != len(self.detections):
+        if self.__catalog is None or \
+                len(self.__catalog) != len(self.detections):
             self.__catalog = get_catalog(self.detections)
         return self.__catalog
 
@@ -154,14 +162,17 @@ class Family(object):
         """
         if isinstance(other, Family):
             if other.template == self.template:
+                if self.__catalog is not None:
+                    # Re-uses the other catalog if it is up to date
+                    self.__catalog.events.extend(other.catalog.events)
                 self.detections.extend(other.detections)
-                self.__catalog.events.extend(get_catalog(other.detections))
             else:
                 raise NotImplementedError('Templates do not match')
         elif isinstance(other, Detection) and other.template_name \
                 == self.template.name:
             self.detections.append(other)
-            self.__catalog.events.extend(get_catalog([other]))
+            if self.__catalog is not None and other.event:
+                self.__catalog.append(other.event)
         elif isinstance(other, Detection):
             raise NotImplementedError('Templates do not match')
         else:
@@ -214,18 +225,31 @@ class Family(object):
         >>> family_a == family_c
         False
         """
-        if not self.template.__eq__(other.template, verbose=verbose):
+        if self is other:
+            return True
+        if not isinstance(other, Family):
             return False
+        # Cheap checks first to avoid comparing template streams
         if len(self.detections) != len(other.detections):
             return False
+        if self.template.name != other.template.name:
+            return False
+        if not np.array_equal(
+                np.sort(_detection_arrays(
+                    self.detections, ['detect_val'])['detect_val']),
+                np.sort(_detection_arrays(
+                    other.detections, ['detect_val'])['detect_val'])):
+            return False
+        if self.template is not other.template and \
+                not self.template.__eq__(other.template, verbose=verbose):
+            return False
         if len(self.detections) != 0 and len(other.detections) != 0:
-            for det, other_det in zip(self.sort().detections,
-                                      other.sort().detections):
+            for det, other_det in zip(_sort_detections(self.detections),
+                                      _sort_detections(other.detections)):
                 if not det.__eq__(other_det, verbose=verbose):
                     return False
-        # currently not checking for catalog...
-        if len(self.catalog) != len(other.catalog):
-            return False
+        # The catalog is not checked: it is generated from the detections,
+        # and equal detections either both have, or both lack, an event.
         return True
 
     def __ne__(self, other):
@@ -324,9 +348,28 @@ class Family(object):
         >>> len(family._uniq())
         2
         """
+        try:
+            self.detections = list(dict.fromkeys(self.detections))
+            return self
+        except (TypeError, AttributeError):
+            # Unhashable attributes, bucket by what can be hashed.
+            pass
         _detections = []
-        [_detections.append(d) for d in self.detections
-         if not _detections.count(d)]
+        # Bucket detections by cheap, hashable attributes so that the full
+        # (expensive) equality check is only run against likely duplicates.
+        buckets = dict()
+        for d in self.detections:
+            try:
+                key = _detection_key(d)
+                hash(key)
+            except (TypeError, AttributeError):
+                # Share one bucket so these are still compared in full
+                key = None
+            bucket = buckets.setdefault(key, [])
+            if any(d == _d for _d in bucket):
+                continue
+            bucket.append(d)
+            _detections.append(d)
         self.detections = _detections
         return self
 
@@ -355,7 +398,7 @@ class Family(object):
         >>> family.sort()[0].detect_time
         UTCDateTime(1970, 1, 1, 0, 0)
         """
-        self.detections = sorted(self.detections, key=lambda d: d.detect_time)
+        self.detections = _sort_detections(self.detections)
         return self
 
     def copy(self):
@@ -598,11 +641,12 @@ class Family(object):
             min_cc=min_cc, horizontal_chans=horizontal_chans,
             vertical_chans=vertical_chans, cores=cores,
             interpolate=interpolate, plot=plot, plotdir=plotdir)
+        # Reversed so that the first detection is used for repeated ids
+        detections = {d.id: d for d in reversed(self.detections)}
         for detection_id, event in picked_dict.items():
             for pick in event.picks:
                 pick.time += self.template.prepick
-            d = [d for d in self.detections if d.id == detection_id][0]
-            d.event.picks = event.picks
+            detections[detection_id].event.picks = event.picks
         if relative_magnitudes:
             self.relative_magnitudes(
                 stream=processed_stream, pre_processed=True, min_cc=min_cc,
@@ -761,7 +805,73 @@ class Family(object):
             for d in self.detections}
 
 
-def _write_family(family, filename):
+def _sort_detections(detections):
+    """
+    Get a new list of detections sorted by detection time.
+
+    :type detections: list
+    :param detections: List of :class:`eqcorrscan.core.match_filter.Detection`
+
+    :rtype: list
+    """
+    detect_times = _detection_arrays(
+        detections, ['detect_time'])['detect_time']
+    order = np.argsort(detect_times, kind='mergesort')
+    return [detections[i] for i in order]
+
+
+def _detection_arrays(detections, attributes):
+    """
+    Extract the numeric attributes of detections into numpy arrays.
+
+    :type detections: list
+    :param detections: List of :class:`eqcorrscan.core.match_filter.Detection`
+    :type attributes: list
+    :param attributes:
+        Names of the attributes to extract, must be keys of
+        `_DETECTION_DTYPES`.
+
+    :rtype: dict
+    :returns:
+        Dictionary of arrays keyed by attribute name, detect_time is given
+        as a timestamp.
+    """
+    arrays = dict()
+    for attribute in attributes:
+        if attribute == 'detect_time':
+            values = (d.detect_time.timestamp for d in detections)
+        else:
+            values = (getattr(d, attribute) for d in detections)
+        arrays[attribute] = np.fromiter(
+            values, dtype=_DETECTION_DTYPES[attribute],
+            count=len(detections))
+    return arrays
+
+
+def _detection_key(detection):
+    """
+    Get a hashable key of the cheap-to-compare attributes of a detection.
+
+    Detections that are equal will have the same key, but detections with
+    the same key are not necessarily equal.
+
+    :type detection: :class:`eqcorrscan.core.match_filter.Detection`
+    :param detection: Detection to get the key for.
+
+    :rtype: tuple
+    """
+    return (detection.template_name, detection.detect_val,
+            detection.threshold, detection.no_chans)
+
+
+# Columns of family files, in order
+_FAMILY_FILE_COLUMNS = (
+    'template_name', 'detect_time', 'no_chans', 'chans', 'detect_val',
+    'threshold', 'typeofdet', 'threshold_type', 'threshold_input', 'event',
+    'id')
+
+
+def _write_family(family, filename, chunk_size=10000):
     """
     Write a family to a csv file.
 
@@ -769,22 +879,65 @@ def _write_family(family, filename):
     :param family: Family to write to file
     :type filename: str
     :param filename: File to write to.
+    :type chunk_size: int
+    :param chunk_size:
+        Number of detections to format before writing them to file in one
+        block.
     """
-    with open(filename, 'w') as f:
-        for detection in family.detections:
-            det_str = ''
-            for key in detection.__dict__.keys():
-                if key == 'event' and detection.__dict__[key] is not None:
-                    value = str(detection.event.resource_id)
-                elif key in ['threshold', 'detect_val', 'threshold_input']:
-                    value = format(detection.__dict__[key], '.32f').rstrip('0')
+    float_keys = {'threshold', 'detect_val', 'threshold_input'}
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow(_FAMILY_FILE_COLUMNS)
+    with open(filename, 'w', newline='') as f:
+        for i, detection in enumerate(family.detections):
+            row = []
+            for key in _FAMILY_FILE_COLUMNS:
+                value = getattr(detection, key)
+                if key == 'event':
+                    value = str(value.resource_id) if value else ''
+                elif key == 'detect_time':
+                    # Integer nanoseconds round-trip exactly, floats do not
+                    try:
+                        value = str(value.ns)
+                    except AttributeError:
+                        # UTCDateTime.ns is not available before obspy 1.2
+                        value = str(value)
+                elif key in float_keys:
+                    # repr of a float is the shortest string that round-trips
+                    value = repr(float(value))
                 else:
-                    value = str(detection.__dict__[key])
-                det_str += key + ': ' + value + '; '
-            f.write(det_str + '\n')
+                    value = str(value)
+                row.append(value)
+            writer.writerow(row)
+            if (i + 1) % chunk_size == 0:
+                f.write(buffer.getvalue())
+                buffer.seek(0)
+                buffer.truncate()
+        f.write(buffer.getvalue())
     return
 
 
+def _parse_detect_time(value):
+    """Parse a detection time from a family file."""
+    try:
+        return UTCDateTime(ns=int(value))
+    except ValueError:
+        # Older files store detect_time as an isoformat string
+        return UTCDateTime(value)
+
+
+# Parsers for values in family files, keys not given are read as floats
+_FAMILY_FILE_PARSERS = {
+    'detect_time': _parse_detect_time,
+    'chans': _parse_chans,
+    'no_chans': lambda value: int(float(value)),
+    'template_name': str,
+    'typeofdet': str,
+    'id': str,
+    'threshold_type': str,
+}
+
+
 def _read_family(fname, all_cat, template, encoding="UTF8",
                  estimate_origin=True):
     """
@@ -797,33 +950,28 @@ def _read_family(fname, all_cat, template, encoding="UTF8",
     detections = []
     with open(fname, 'rb') as _f:
         lines = _f.read().decode(encoding).splitlines()
-    for line in lines:
+    if len(lines) and lines[0] == ','.join(_FAMILY_FILE_COLUMNS):
+        rows = (dict(zip(_FAMILY_FILE_COLUMNS, row))
+                for row in csv.reader(lines[1:]))
+    else:
+        rows = _read_legacy_family_lines(lines)
+    # Index the catalog by the end of the resource id, keep the first match
+    cat_index = dict()
+    for event in all_cat:
+        cat_index.setdefault(str(event.resource_id).split('/')[-1], event)
+    for row in rows:
         det_dict = {}
         gen_event = False
-        for key_pair in line.rstrip().split(';'):
-            key = key_pair.split(': ')[0].strip()
-            value = key_pair.split(': ')[-1].strip()
+        for key, value in row.items():
             if key == 'event':
-                if len(all_cat) == 0:
+                event = cat_index.get(value.split('/')[-1])
+                if event is None:
                     gen_event = True
                     continue
-                el = [e for e in all_cat
-                      if str(e.resource_id).split('/')[-1] == value][0]
-                det_dict.update({'event': el})
-            elif key == 'detect_time':
-                det_dict.update(
-                    {'detect_time': UTCDateTime(value)})
-            elif key == 'chans':
-                det_dict.update({'chans': ast.literal_eval(value)})
-            elif key in ['template_name', 'typeofdet', 'id',
-                         'threshold_type']:
-                det_dict.update({key: value})
-            elif key == 'no_chans':
-                det_dict.update({key: int(float(value))})
-            elif len(key) == 0:
-                continue
+                det_dict.update({'event': event})
             else:
-                det_dict.update({key: float(value)})
+                parser = _FAMILY_FILE_PARSERS.get(key, float)
+                det_dict.update({key: parser(value)})
         detection = Detection(**det_dict)
         if gen_event:
             detection._calculate_event(
@@ -833,6 +981,26 @@ def _read_family(fname, all_cat, template, encoding="UTF8",
     return detections
 
 
+def _read_legacy_family_lines(lines):
+    """
+    Split lines of the older 'key: value; ' family format.
+
+    :type lines: list
+    :param lines: Lines of the file.
+
+    :return: Generator of dictionaries of strings keyed by attribute name.
+    """
+    for line in lines:
+        row = dict()
+        for key_pair in line.rstrip().split(';'):
+            key, sep, value = key_pair.partition(': ')
+            if not sep:
+                # Trailing or empty fragment
+                continue
+            row[key.strip()] = value.strip()
+        yield row
+
+
 if __name__ == "__main__":
     import doctest
 
@@ -18,6 +18,8 @@ import shutil
 import tarfile
 import tempfile
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import cpu_count
 from os.path import join
 
 import numpy as np
@@ -578,7 +580,7 @@ class Party(object):
         return copy.deepcopy(self)
 
     def write(self, filename, format='tar', write_detection_catalog=True,
-              catalog_format="QUAKEML"):
+              catalog_format="QUAKEML", max_workers=None):
         """
         Write Family out, select output format.
 
@@ -599,6 +601,11 @@ class Party(object):
             SC3ML, QUAKEML are supported. Note that not all information is
             written for all formats (QUAKEML is the most complete, but is
             slow for IO).
+        :type max_workers: int
+        :param max_workers:
+            Maximum number of threads to use for writing families in parallel
+            when writing to the 'tar' format. If None then all threads will
+            be used.
 
         .. NOTE::
             csv format will write out detection objects, all other
@@ -653,11 +660,26 @@ class Party(object):
                             join(temp_dir, 'catalog.{0}'.format(
                                 CAT_EXT_MAP[catalog_format])),
                             format=catalog_format)
-                for i, family in enumerate(self.families):
-                    Logger.debug('Writing family %i' % i)
-                    name = family.template.name + '_detections.csv'
-                    name_to_write = join(temp_dir, name)
-                    _write_family(family=family, filename=name_to_write)
+                # Families are written to files named by their template, so
+                # only the last family of any name would survive; write just
+                # that one rather than having threads race on one file.
+                families = {f.template.name: f for f in self.families}
+                if len(families) < len(self.families):
+                    Logger.warning(
+                        'Party contains families with duplicate template '
+                        'names, only the last of each will be written')
+                max_workers = max_workers or cpu_count()
+                with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                    results = []
+                    for i, family in enumerate(families.values()):
+                        Logger.debug('Writing family %i' % i)
+                        name = family.template.name + '_detections.csv'
+                        name_to_write = join(temp_dir, name)
+                        results.append(executor.submit(
+                            _write_family, family=family,
+                            filename=name_to_write))
+                for result in results:
+                    result.result()  # Raise any errors from writing
                 if not filename.endswith('.tgz'):
                     filename = filename + ".tgz"
                 with tarfile.open(filename, "w:gz") as tar:
@@ -7,18 +7,113 @@ import numpy as np
 import os
 import glob
 import logging
+import pickle
+import shutil
+import tempfile
 
+from scipy.signal import iirfilter, sosfilt
 from obspy.core.event import Event, Pick, WaveformStreamID
-from obspy import UTCDateTime, read, Trace
+from obspy import (
+    UTCDateTime, read, read_events, read_inventory, Trace, Stream, Catalog,
+    Inventory)
 from obspy.clients.fdsn import Client
 
 from eqcorrscan.utils import mag_calc
 from eqcorrscan.utils.mag_calc import (
-    dist_calc, _sim_WA, _max_p2t, _pairwise, svd_moments, amp_pick_event,
-    _snr, relative_amplitude, relative_magnitude)
+    dist_calc, dist_calc_batch, _sim_WA, _max_p2t, _pairwise, svd_moments,
+    amp_pick_event, _snr, relative_amplitude, relative_magnitude)
 from eqcorrscan.utils.clustering import svd
 from eqcorrscan.helpers.mock_logger import MockLoggingHandler
 
+Logger = logging.getLogger(__name__)
+
+# Downloaded data are cached here, set EQCORRSCAN_REFRESH_CACHE=True to
+# force a fresh download.
+CACHE_PATH = os.path.join(
+    os.path.abspath(os.path.dirname(__file__)), 'test_data', 'network_cache')
+REFRESH_CACHE = os.getenv("EQCORRSCAN_REFRESH_CACHE", "False") == "True"
+# Object-type: (file extension, format, reader)
+CACHE_FORMATS = {
+    Catalog: (".xml", "QUAKEML", read_events),
+    Stream: (".ms", "MSEED", read),
+    Inventory: (".sxml", "STATIONXML", read_inventory)}
+
+
+def _cached_download(name, download, client_name="GEONET"):
+    """
+    Get data from disk if cached, otherwise download and cache them.
+
+    Each set of data is written to a temporary directory and moved into
+    place in one step, so a partial cache is never read. If the cache cannot
+    be written (e.g. a read-only install) the data are returned uncached.
+
+    :type name: str
+    :param name: Unique name for this set of data.
+    :type download: callable
+    :param download:
+        Function taking an FDSN client and returning a dict of Catalog,
+        Stream and Inventory objects.
+    :type client_name: str
+    :param client_name: FDSN client to download from if needed.
+
+    :returns: dict of data keyed as returned by download.
+    """
+    cache_dir = os.path.join(CACHE_PATH, name)
+    if os.path.isdir(cache_dir) and not REFRESH_CACHE:
+        data = dict()
+        for fname in os.listdir(cache_dir):
+            key, ext = os.path.splitext(fname)
+            for _ext, fmt, reader in CACHE_FORMATS.values():
+                if ext == _ext:
+                    data.update({key: reader(
+                        os.path.join(cache_dir, fname), format=fmt)})
+                    break
+        return data
+    data = download(Client(client_name))
+    try:
+        if not os.path.isdir(CACHE_PATH):
+            os.makedirs(CACHE_PATH)
+        tmp_dir = tempfile.mkdtemp(dir=CACHE_PATH)
+        try:
+            for key, obj in data.items():
+                ext, fmt, _ = CACHE_FORMATS[type(obj)]
+                obj.write(os.path.join(tmp_dir, key + ext), format=fmt)
+            if os.path.isdir(cache_dir):
+                shutil.rmtree(cache_dir)
+            os.replace(tmp_dir, cache_dir)
+        finally:
+            if os.path.isdir(tmp_dir):
+                shutil.rmtree(tmp_dir)
+    except OSError as e:
+        Logger.warning("Could not cache {0}: {1}".format(name, e))
+    return data
+
+
+def _batch_bandpass(st, freqmin, freqmax, corners=4):
+    """
+    Band-pass all traces in a stream in place, designing the filter once.
+
+    Equivalent to obspy's (causal) bandpass filter, but filters all traces
+    as one array when they share a sampling-rate and length. Falls back to
+    :meth:`obspy.core.stream.Stream.filter` otherwise.
+    """
+    if len({(tr.stats.sampling_rate, tr.stats.npts) for tr in st}) != 1:
+        return st.filter("bandpass", freqmin=freqmin, freqmax=freqmax,
+                         corners=corners)
+    fe = 0.5 * st[0].stats.sampling_rate
+    sos = iirfilter(corners, [freqmin / fe, freqmax / fe], btype='band',
+                    ftype='butter', output='sos')
+    filtered = sosfilt(
+        sos, np.asarray([tr.data for tr in st], dtype=np.float64), axis=1)
+    for tr, data in zip(st, filtered):
+        tr.data = data
+    return st
+
+
+# obspy's example stream, read (and filtered) once and copied by tests
+_BASE_ST_RAW = read()
+_BASE_ST = _batch_bandpass(_BASE_ST_RAW.copy(), freqmin=2, freqmax=20)
+
 
 class TestMagCalcMethods(unittest.TestCase):
     """Test all mag_calc functions."""
@@ -38,6 +133,33 @@ class TestMagCalcMethods(unittest.TestCase):
         self.assertEqual(round(dist_calc((0, 180, 0), (0, -179, 0))), 111)
         self.assertEqual(round(dist_calc((0, -180, 0), (0, 179, 0))), 111)
 
+    def test_dist_calc_batch(self):
+        """
+        Test that the batched distance calculation matches dist_calc.
+        """
+        loc1 = np.array([
+            (0, 0, 0), (0, 0, 0), (0, 0, 0), (45, 45, 0), (45, 45, 0),
+            (45, 45, 0), (90, 90, 0), (90, 90, 0), (90, 90, 0), (0, 180, 0),
+            (0, -180, 0)], dtype=np.float64)
+        loc2 = np.array([
+            (0, 0, 10), (0, 1, 0), (1, 0, 0), (45, 45, 10), (45, 46, 0),
+            (46, 45, 0), (90, 90, 10), (90, 89, 0), (89, 90, 0),
+            (0, -179, 0), (0, 179, 0)], dtype=np.float64)
+        expected = [10, 111, 111, 10, 79, 111, 10, 0, 111, 111, 111]
+        distances = dist_calc_batch(loc1, loc2)
+        np.testing.assert_allclose(np.round(distances), expected)
+        np.testing.assert_allclose(dist_calc(loc1, loc2), distances)
+        np.testing.assert_allclose(
+            distances, [dist_calc(l1, l2) for l1, l2 in zip(loc1, loc2)],
+            rtol=1e-5)
+        # A single location is paired with every row of the other
+        np.testing.assert_allclose(
+            dist_calc(loc1[0], loc2[0:3]), distances[0:3])
+        np.testing.assert_allclose(
+            dist_calc(loc1[0:3], loc2[0]), [10, 10, 10])
+        with self.assertRaises(ValueError):
+            dist_calc_batch(loc1, loc2[0:3])
+
     @pytest.mark.network
     @pytest.mark.flaky(reruns=2)
     def test_sim_WA(self):
@@ -68,10 +190,12 @@ class TestMagCalcMethods(unittest.TestCase):
 
     def test_pairwise(self):
         """Test the itertools wrapper"""
-        pairs = _pairwise(range(20))
-        for i, pair in enumerate(pairs):
-            self.assertEqual(pair[0] + 1, pair[1])
-        self.assertEqual(i, 18)
+        pairs = np.fromiter(
+            (p for pair in _pairwise(range(20)) for p in pair),
+            dtype=np.int64).reshape(-1, 2)
+        self.assertEqual(len(pairs), 19)
+        np.testing.assert_array_equal(pairs[:, 0], np.arange(19))
+        np.testing.assert_array_equal(pairs[:, 1] - pairs[:, 0], 1)
 
     def test_SVD_mag(self):
         """Test the SVD magnitude calculator."""
@@ -80,17 +204,15 @@ class TestMagCalcMethods(unittest.TestCase):
                                     'test_data', 'similar_events_processed')
         stream_files = glob.glob(os.path.join(testing_path, '*DFDPC*'))
         stream_list = [read(stream_file) for stream_file in stream_files]
+        allowed = frozenset({
+            ('WHAT2', 'SH1'), ('WV04', 'SHZ'), ('GCSZ', 'EHZ')})
         event_list = []
         for i, stream in enumerate(stream_list):
-            st_list = []
-            for tr in stream:
-                if (tr.stats.station, tr.stats.channel) not in\
-                        [('WHAT2', 'SH1'), ('WV04', 'SHZ'), ('GCSZ', 'EHZ')]:
-                    stream.remove(tr)
-                    continue
-                st_list.append(i)
-            event_list.append(st_list)
-        event_list = np.asarray(event_list).T.tolist()
+            stream.traces = [
+                tr for tr in stream
+                if (tr.stats.station, tr.stats.channel) in allowed]
+            event_list.append([i] * len(stream))
+        event_list = [list(col) for col in zip(*event_list)]
         SVectors, SValues, Uvectors, stachans = svd(stream_list=stream_list)
         M, events_out = svd_moments(u=Uvectors, s=SValues, v=SVectors,
                                     stachans=stachans, event_list=event_list)
@@ -103,45 +225,52 @@ class TestRelativeAmplitudes(unittest.TestCase):
     @classmethod
     @pytest.mark.network
     def setUpClass(cls):
-        client = Client("GEONET")
-        event1 = client.get_events(eventid="2016p912302")[0]
-        event2 = client.get_events(eventid="3470170")[0]
-        shared_chans = {p1.waveform_id.get_seed_string()
-                        for p1 in event1.picks}.intersection(
-            {p2.waveform_id.get_seed_string() for p2 in event2.picks})
-        bulk = [(p.waveform_id.network_code, p.waveform_id.station_code,
-                 p.waveform_id.location_code, p.waveform_id.channel_code,
-                 p.time - 20, p.time + 60) for p in event1.picks
-                if p.waveform_id.get_seed_string() in shared_chans]
-        st1 = client.get_waveforms_bulk(bulk)
-        st1 = st1.detrend().filter("bandpass", freqmin=2, freqmax=20)
-        bulk = [(p.waveform_id.network_code, p.waveform_id.station_code,
-                 p.waveform_id.location_code, p.waveform_id.channel_code,
-                 p.time - 20, p.time + 60) for p in event2.picks
-                if p.waveform_id.get_seed_string() in shared_chans]
-        st2 = client.get_waveforms_bulk(bulk)
-        st2 = st2.detrend().filter("bandpass", freqmin=2, freqmax=20)
-        cls.event1 = event1
-        cls.event2 = event2
+        def download(client):
+            cat1 = client.get_events(eventid="2016p912302")
+            cat2 = client.get_events(eventid="3470170")
+            # Work out seed ids once per pick
+            seed_ids = [[p.waveform_id.get_seed_string() for p in cat[0].picks]
+                        for cat in (cat1, cat2)]
+            shared_chans = set(seed_ids[0]).intersection(seed_ids[1])
+            if not shared_chans:
+                # An empty bulk request could ask for everything
+                raise unittest.SkipTest("No shared channels between events")
+            bulk1, bulk2 = [], []
+            for cat, event_seed_ids, bulk in zip(
+                    (cat1, cat2), seed_ids, (bulk1, bulk2)):
+                bulk.extend(
+                    (p.waveform_id.network_code, p.waveform_id.station_code,
+                     p.waveform_id.location_code, p.waveform_id.channel_code,
+                     p.time - 20, p.time + 60)
+                    for p, seed_id in zip(cat[0].picks, event_seed_ids)
+                    if seed_id in shared_chans)
+            st1 = client.get_waveforms_bulk(bulk1)
+            st2 = client.get_waveforms_bulk(bulk2)
+            return dict(cat1=cat1, cat2=cat2, st1=st1, st2=st2)
+
+        data = _cached_download("relative_amplitudes", download)
+        st1 = _batch_bandpass(data["st1"].detrend(), freqmin=2, freqmax=20)
+        st2 = _batch_bandpass(data["st2"].detrend(), freqmin=2, freqmax=20)
+        cls.event1 = data["cat1"][0]
+        cls.event2 = data["cat2"][0]
         cls.st1 = st1
         cls.st2 = st2
 
     def test_snr(self):
-        noise = np.random.randn(100)
-        signal = np.random.randn(100)
-        signal[50] = 100
-        trace = Trace(data=np.concatenate([noise, signal]))
+        # First 100 samples are noise, the last 100 are the signal
+        data = np.random.RandomState(0).randn(200)
+        data[150] = 100
+        trace = Trace(data=data)
         trace.stats.sampling_rate = 1.
         snr = _snr(
             tr=trace,
             noise_window=(trace.stats.starttime, trace.stats.starttime + 100),
             signal_window=(trace.stats.starttime + 100, trace.stats.endtime))
-        self.assertLessEqual(abs(100 - snr), 30)
+        self.assertLessEqual(abs(100 - snr), 5)
 
     def test_scaled_event(self):
         scale_factor = 0.2
-        st1 = read()
-        st1.filter("bandpass", freqmin=2, freqmax=20)
+        st1 = _BASE_ST.copy()
         st2 = st1.copy()
         event1 = Event(picks=[
             Pick(time=tr.stats.starttime + 5, phase_hint="P",
@@ -158,8 +287,7 @@ class TestRelativeAmplitudes(unittest.TestCase):
 
     def test_no_suitable_picks_event1(self):
         scale_factor = 0.2
-        st1 = read()
-        st1.filter("bandpass", freqmin=2, freqmax=20)
+        st1 = _BASE_ST.copy()
         st2 = st1.copy()
         event1 = Event(picks=[
             Pick(time=tr.stats.starttime + 5, phase_hint="S",
@@ -176,8 +304,7 @@ class TestRelativeAmplitudes(unittest.TestCase):
         import copy
 
         scale_factor = 0.2
-        st1 = read()
-        st1.filter("bandpass", freqmin=2, freqmax=20)
+        st1 = _BASE_ST.copy()
         st2 = st1.copy()
         event1 = Event(picks=[
             Pick(time=tr.stats.starttime + 5, phase_hint="P",
@@ -196,8 +323,7 @@ class TestRelativeAmplitudes(unittest.TestCase):
         import copy
 
         scale_factor = 0.2
-        st1 = read()
-        st1.filter("bandpass", freqmin=2, freqmax=20)
+        st1 = _BASE_ST.copy()
         st2 = st1.copy()
         event1 = Event(picks=[
             Pick(time=tr.stats.starttime + 5, phase_hint="P",
@@ -213,8 +339,7 @@ class TestRelativeAmplitudes(unittest.TestCase):
 
     def test_no_picks_event1(self):
         scale_factor = 0.2
-        st1 = read()
-        st1.filter("bandpass", freqmin=2, freqmax=20)
+        st1 = _BASE_ST.copy()
         st2 = st1.copy()
         event1 = Event()
         event2 = event1
@@ -226,10 +351,16 @@ class TestRelativeAmplitudes(unittest.TestCase):
 
     def test_low_snr(self):
         scale_factor = 0.2
-        st1 = read()
-        st1[0].data += np.random.randn(st1[0].stats.npts) * st1[0].data.max()
+        random = np.random.RandomState(42)
+        st1 = _BASE_ST_RAW.copy()
+        # Scale the noise in place to avoid another temporary array
+        noise = random.randn(st1[0].stats.npts)
+        noise *= st1[0].data.max()
+        st1[0].data += noise
         st2 = st1.copy()
-        st2[1].data += np.random.randn(st2[1].stats.npts) * st2[1].data.max()
+        noise = random.randn(st2[1].stats.npts)
+        noise *= st2[1].data.max()
+        st2[1].data += noise
         event1 = Event(picks=[
             Pick(time=tr.stats.starttime + 5, phase_hint="P",
                  waveform_id=WaveformStreamID(seed_string=tr.id))
@@ -278,57 +409,68 @@ class TestAmpPickEvent(unittest.TestCase):
         cls._log_handler = MockLoggingHandler(level='DEBUG')
         log.addHandler(cls._log_handler)
         cls.log_messages = cls._log_handler.messages
-        client = Client("GEONET")
-        cls.event = client.get_events(eventid="2019p498440")[0]
-        origin_time = cls.event.preferred_origin().time
-        bulk = [(
-            p.waveform_id.network_code, p.waveform_id.station_code,
-            p.waveform_id.location_code, p.waveform_id.channel_code,
-            origin_time - 10, origin_time + 120)
-            for p in cls.event.picks]
-        cls.inventory = client.get_stations_bulk(bulk, level='response')
-        cls.st = client.get_waveforms_bulk(bulk)
+
+        def download(client):
+            cat = client.get_events(eventid="2019p498440")
+            origin_time = cat[0].preferred_origin().time
+            bulk = [(
+                p.waveform_id.network_code, p.waveform_id.station_code,
+                p.waveform_id.location_code, p.waveform_id.channel_code,
+                origin_time - 10, origin_time + 120)
+                for p in cat[0].picks]
+            inventory = client.get_stations_bulk(bulk, level='response')
+            st = client.get_waveforms_bulk(bulk)
+            return dict(cat=cat, inventory=inventory, st=st)
+
+        data = _cached_download("amp_pick_event", download)
+        cls.event = data["cat"][0]
+        cls.inventory = data["inventory"]
+        cls.st = data["st"]
         cls.available_stations = len({p.waveform_id.station_code
                                       for p in cls.event.picks})
+        # Unpickling is cheaper than deep-copying the event for every test
+        cls._pickled_event = pickle.dumps(cls.event)
 
     def setUp(self):
         self._log_handler.reset()
 
+    def _fresh_event(self):
+        """ Get an independent copy of the event for amp_pick_event to edit.
+        """
+        return pickle.loads(self._pickled_event)
+
     def test_amp_pick_event(self):
         """Test the main amplitude picker."""
         picked_event = amp_pick_event(
-            event=self.event.copy(), st=self.st.copy(),
+            event=self._fresh_event(), st=self.st.copy(),
             inventory=self.inventory)
         self.assertEqual(len(picked_event.picks),
                          len(self.st) + self.available_stations)
 
     def test_amp_pick_remove_old_picks(self):
         picked_event = amp_pick_event(
-            event=self.event.copy(), st=self.st.copy(),
+            event=self._fresh_event(), st=self.st.copy(),
             inventory=self.inventory, remove_old=True)
         self.assertEqual(len(picked_event.amplitudes), self.available_stations)
 
     def test_amp_pick_missing_channel(self):
         picked_event = amp_pick_event(
-            event=self.event.copy(), st=self.st.copy()[0:-3],
+            event=self._fresh_event(), st=self.st.copy()[0:-3],
             inventory=self.inventory, remove_old=True)
-        missed = False
-        for warning in self.log_messages['warning']:
-            if 'no station and channel match' in warning:
-                missed = True
-        self.assertTrue(missed)
+        self.assertTrue(any('no station and channel match' in warning
+                            for warning in self.log_messages['warning']))
         self.assertEqual(len(picked_event.amplitudes),
                          self.available_stations - 1)
 
     def test_amp_pick_not_varwin(self):
         picked_event = amp_pick_event(
-            event=self.event.copy(), st=self.st.copy(),
+            event=self._fresh_event(), st=self.st.copy(),
             inventory=self.inventory, remove_old=True,
             var_wintype=False)
         self.assertEqual(len(picked_event.amplitudes), self.available_stations)
 
     def test_amp_pick_not_varwin_no_S(self):
-        event = self.event.copy()
+        event = self._fresh_event()
         for pick in event.picks:
             if pick.phase_hint.upper() == 'S':
                 event.picks.remove(pick)
@@ -338,7 +480,7 @@ class TestAmpPickEvent(unittest.TestCase):
         self.assertEqual(len(picked_event.amplitudes), 1)
 
     def test_amp_pick_varwin_no_S(self):
-        event = self.event.copy()
+        event = self._fresh_event()
         for pick in event.picks:
             if pick.phase_hint.upper() == 'S':
                 event.picks.remove(pick)
@@ -348,7 +490,7 @@ class TestAmpPickEvent(unittest.TestCase):
         self.assertEqual(len(picked_event.amplitudes), 1)
 
     def test_amp_pick_varwin_no_P(self):
-        event = self.event.copy()
+        event = self._fresh_event()
         for pick in event.picks:
             if pick.phase_hint.upper() == 'P':
                 event.picks.remove(pick)
@@ -359,14 +501,14 @@ class TestAmpPickEvent(unittest.TestCase):
 
     def test_amp_pick_high_min_snr(self):
         picked_event = amp_pick_event(
-            event=self.event.copy(), st=self.st.copy(),
+            event=self._fresh_event(), st=self.st.copy(),
             inventory=self.inventory, remove_old=True, var_wintype=False,
             min_snr=15)
         self.assertEqual(len(picked_event.amplitudes), 0)
 
     def test_amp_pick_no_prefilt(self):
         picked_event = amp_pick_event(
-            event=self.event.copy(), st=self.st.copy(),
+            event=self._fresh_event(), st=self.st.copy(),
             inventory=self.inventory, remove_old=True,
             var_wintype=False, pre_filt=False)
         self.assertEqual(len(picked_event.amplitudes), 4)
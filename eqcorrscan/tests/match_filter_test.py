@@ -1184,6 +1184,43 @@ class TestMatchObjectLight(unittest.TestCase):
             if os.path.isfile('test_party_out.tgz'):
                 os.remove('test_party_out.tgz')
 
+    def test_party_io_max_workers(self):
+        """Test that writing in serial and parallel give the same party."""
+        fnames = ['test_party_serial.tgz', 'test_party_parallel.tgz']
+        for fname in fnames:
+            if os.path.isfile(fname):
+                os.remove(fname)
+        try:
+            self.party.write(filename=fnames[0], max_workers=1)
+            self.party.write(filename=fnames[1])
+            party_serial = read_party(fname=fnames[0])
+            party_parallel = read_party(fname=fnames[1])
+            self.assertEqual(party_serial, party_parallel)
+            self.assertEqual(self.party, party_parallel)
+        finally:
+            for fname in fnames:
+                if os.path.isfile(fname):
+                    os.remove(fname)
+
+    def test_party_io_duplicate_names(self):
+        """Test that the last family of a duplicated name is written."""
+        fname = 'test_party_duplicates.tgz'
+        if os.path.isfile(fname):
+            os.remove(fname)
+        party = self.party.copy()
+        duplicate = party[0].copy()
+        duplicate.detections = duplicate.detections[0:1]
+        party.families.append(duplicate)
+        try:
+            party.write(filename=fname)
+            party_back = read_party(fname=fname)
+            self.assertEqual(len(party_back), len(self.party))
+            self.assertEqual(
+                party_back.select(duplicate.template.name), duplicate)
+        finally:
+            if os.path.isfile(fname):
+                os.remove(fname)
+
     def test_party_write_csv(self):
         """ There was an issue (#298) where the header was repeated."""
         party = Party().read()
@@ -1258,6 +1295,64 @@ class TestMatchObjectLight(unittest.TestCase):
         fam_copy.detections = []
         self.assertFalse(family == fam_copy)
 
+    def test_detection_hash(self):
+        """Check that separately built, equal detections hash the same."""
+        def make_detection(detect_time):
+            return Detection(
+                template_name='a', detect_time=detect_time, no_chans=2,
+                detect_val=1.6, threshold=1.0, typeofdet='corr',
+                threshold_type='MAD', threshold_input=8.0,
+                chans=[('A', 'EHZ'), ('B', 'EHZ')], id='a_20120101_000000')
+
+        detection = make_detection(UTCDateTime(2012, 1, 1))
+        # Built differently, but equal at UTCDateTime's precision
+        other = make_detection(
+            UTCDateTime("2012-01-01T00:00:00.0000001"))
+        self.assertEqual(detection, other)
+        self.assertEqual(hash(detection), hash(other))
+        # Times of different precision are compared at the lower precision
+        coarse = make_detection(UTCDateTime(0, precision=3))
+        precise = make_detection(UTCDateTime(0.0004))
+        self.assertEqual(coarse, precise)
+        self.assertEqual(hash(coarse), hash(precise))
+        later = make_detection(UTCDateTime(2012, 1, 1, 0, 0, 1))
+        self.assertNotEqual(detection, later)
+        self.assertEqual(len({detection, other, later}), 2)
+
+    def test_family_uniq(self):
+        """Check that only duplicate detections are removed, in order."""
+        family = self.family.copy()
+        detection = family.detections[0]
+        later_detection = detection.copy()
+        later_detection.detect_time += 10
+        # Same cheap attributes as detection, but different channels
+        other_chans = detection.copy()
+        other_chans.chans = other_chans.chans[0:1]
+        self.assertEqual(hash(detection), hash(detection.copy()))
+        family.detections = [
+            detection, later_detection, detection.copy(), other_chans,
+            later_detection.copy()]
+        family._uniq()
+        self.assertEqual(len(family), 3)
+        self.assertEqual(family.detections[0], detection)
+        self.assertEqual(family.detections[1], later_detection)
+        self.assertEqual(family.detections[2], other_chans)
+
+    def test_family_uniq_unhashable(self):
+        """Check that detections that cannot be hashed are de-duplicated."""
+        family = self.family.copy()
+        detection = family.detections[0].copy()
+        # Lists cannot be hashed, so this forces the fallback comparison
+        detection.template_name = [detection.template_name]
+        later_detection = detection.copy()
+        later_detection.detect_time += 10
+        family.detections = [
+            detection, later_detection, detection.copy(), detection.copy()]
+        family._uniq()
+        self.assertEqual(len(family), 2)
+        self.assertEqual(family.detections[0], detection)
+        self.assertEqual(family.detections[1], later_detection)
+
     def test_family_slicing(self):
         """Check getting items returns the expected result."""
         family = self.family.copy()
@@ -1287,6 +1382,23 @@ class TestMatchObjectLight(unittest.TestCase):
             if os.path.isfile('test_family.tgz'):
                 os.remove('test_family.tgz')
 
+    def test_family_io_detect_time(self):
+        """Check that detection times are read back exactly."""
+        family = self.family.copy()
+        for i, detection in enumerate(family.detections):
+            # Half a microsecond is not exact as a float epoch timestamp
+            detection.detect_time = UTCDateTime(
+                ns=1576800000000000500 + i * 1000)
+        try:
+            family.write('test_family_times')
+            party_back = read_party('test_family_times.tgz')
+            self.assertEqual(
+                [d.detect_time for d in party_back[0].sort().detections],
+                [d.detect_time for d in family.sort().detections])
+        finally:
+            if os.path.isfile('test_family_times.tgz'):
+                os.remove('test_family_times.tgz')
+
     def test_family_catalogs(self):
         """Check that the catalog always represents the detections"""
         family = self.family.copy()
@@ -1296,6 +1408,10 @@ class TestMatchObjectLight(unittest.TestCase):
         for pick in additional_detection.event.picks:
             pick.time += 3600
         added_family = family + additional_detection
+        self.assertEqual(added_family.catalog,
+                         get_catalog(added_family.detections))
+        # In-place addition should update an existing catalog
+        added_family += family[0].copy()
         self.assertEqual(added_family.catalog,
                          get_catalog(added_family.detections))
         family.detections.append(additional_detection)
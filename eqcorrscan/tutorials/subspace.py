@@ -10,9 +10,11 @@ http://quakesearch.geonet.org.nz/services/1.0.0/csv?bbox=175.37956,-40.97912,175
 """
 
 import logging
+import os
+import sys
 
 from obspy.clients.fdsn import Client
-from obspy import UTCDateTime, Stream
+from obspy import UTCDateTime, Stream, read, read_events
 
 from eqcorrscan.utils.catalog_utils import filter_picks
 from eqcorrscan.utils.clustering import catalog_cluster
@@ -25,17 +27,23 @@ logging.basicConfig(
 
 
 def run_tutorial(plot=False, multiplex=True, return_streams=False, cores=4,
-                 verbose=False):
+                 verbose=False, use_cache=False):
     """
     Run the tutorial.
 
+    :param use_cache:
+        Whether to read downloaded data from, and save them to, CACHE_DIR.
+        Defaults to False so that fresh data are always used.
+
     :return: detections
     """
-    client = Client("GEONET", debug=verbose)
-    cat = client.get_events(
-        minlatitude=-40.98, maxlatitude=-40.85, minlongitude=175.4,
-        maxlongitude=175.5, starttime=UTCDateTime(2016, 5, 1),
-        endtime=UTCDateTime(2016, 5, 20))
+    starttime, endtime = UTCDateTime(2016, 5, 1), UTCDateTime(2016, 5, 20)
+    cat = _cached(
+        "events_{0}_{1}.xml".format(starttime.date, endtime.date),
+        lambda: Client("GEONET", debug=verbose).get_events(
+            minlatitude=-40.98, maxlatitude=-40.85, minlongitude=175.4,
+            maxlongitude=175.5, starttime=starttime, endtime=endtime),
+        use_cache=use_cache)
     print("Downloaded a catalog of %i events" % len(cat))
     # This gives us a catalog of events - it takes a while to download all
     # the information, so give it a bit!
@@ -49,26 +57,36 @@ def run_tutorial(plot=False, multiplex=True, return_streams=False, cores=4,
     clusters = catalog_cluster(
         catalog=cat, metric="distance", thresh=2, show=False)
     # We will work on the largest cluster
-    cluster = sorted(clusters, key=lambda c: len(c))[-1]
+    cluster = max(reversed(clusters), key=len)
     # This cluster contains 32 events, we will now download and trim the
     # waveforms.  Note that each chanel must start at the same time and be the
     # same length for multiplexing.  If not multiplexing EQcorrscan will
     # maintain the individual differences in time between channels and delay
     # the detection statistics by that amount before stacking and detection.
-    client = Client('GEONET')
-    design_set = []
-    st = Stream()
-    for event in cluster:
-        print("Downloading for event {0}".format(event.resource_id.id))
-        bulk_info = []
-        t1 = event.origins[0].time
-        t2 = t1 + 25.1  # Have to download extra data, otherwise GeoNet will
-        # trim wherever suits.
-        t1 -= 0.1
-        for station, channel in stachans:
-            bulk_info.append(('NZ', station, '*', channel[0:2] + '?', t1, t2))
-        st += client.get_waveforms_bulk(bulk=bulk_info)
+
+    # Picks on different components of one station share a request, so
+    # only ask for each station and channel pattern once.
+    design_channels = list(dict.fromkeys(
+        (station, channel[0:2] + '?') for station, channel in stachans))
+
+    def download_design_data():
+        client = Client('GEONET')
+        st = Stream()
+        for event in cluster:
+            print("Downloading for event {0}".format(event.resource_id.id))
+            t1 = event.origins[0].time
+            t2 = t1 + 25.1  # Have to download extra data, otherwise GeoNet
+            # will trim wherever suits.
+            t1 -= 0.1
+            bulk_info = [('NZ', station, '*', channel, t1, t2)
+                         for station, channel in design_channels]
+            st += client.get_waveforms_bulk(bulk=bulk_info)
+        return st
+
+    st = _cached("design_{0}_{1}.ms".format(starttime.date, endtime.date),
+                 download_design_data, use_cache=use_cache)
     print("Downloaded %i channels" % len(st))
+    design_set = []
     for event in cluster:
         t1 = event.origins[0].time
         t2 = t1 + 25
@@ -89,11 +107,17 @@ def run_tutorial(plot=False, multiplex=True, return_streams=False, cores=4,
     t2 = UTCDateTime(2016, 5, 11, 20)
     # We are going to look in a single hour just to minimize cost, but you can
     # run for much longer.
-    bulk_info = [('NZ', stachan[0], '*',
-                  stachan[1][0] + '?' + stachan[1][-1],
-                  t1, t2) for stachan in detector.stachans]
+    channels = dict.fromkeys(
+        (station, channel[0] + '?' + channel[-1])
+        for station, channel in detector.stachans)
+    bulk_info = [('NZ', station, '*', channel, t1, t2)
+                 for station, channel in channels]
     print("Downloading continuous data")
-    st = client.get_waveforms_bulk(bulk_info)
+    st = _cached(
+        "continuous_{0}_{1}.ms".format(t1.strftime("%Y%m%dT%H"),
+                                       t2.strftime("%Y%m%dT%H")),
+        lambda: Client('GEONET').get_waveforms_bulk(bulk_info),
+        use_cache=use_cache)
     st.merge().detrend('simple').trim(starttime=t1, endtime=t2)
     # We set a very low threshold because the detector is not that great, we
     # haven't aligned it particularly well - however, at this threshold we make
@@ -108,5 +132,37 @@ def run_tutorial(plot=False, multiplex=True, return_streams=False, cores=4,
         return detections
 
 
+# Caching of downloaded data, used when the tutorial is run as a script so
+# that it can be re-run offline.
+CACHE_DIR = os.path.join(
+    os.path.expanduser("~"), ".cache", "eqcorrscan", "tutorial_subspace")
+
+
+def _cached(name, download, use_cache=True):
+    """
+    Read data from the tutorial cache, or download and cache them.
+
+    :type name: str
+    :param name: File name in the cache, ending in .xml or .ms
+    :type download: callable
+    :param download: Function to get the data if they are not cached.
+    :type use_cache: bool
+    :param use_cache: Set to False to always download and not cache.
+
+    :return: Catalog or Stream
+    """
+    fname = os.path.join(CACHE_DIR, name)
+    fmt = {".xml": "QUAKEML", ".ms": "MSEED"}[os.path.splitext(name)[-1]]
+    if use_cache and os.path.isfile(fname):
+        reader = read_events if fmt == "QUAKEML" else read
+        return reader(fname, format=fmt)
+    data = download()
+    if use_cache:
+        if not os.path.isdir(CACHE_DIR):
+            os.makedirs(CACHE_DIR)
+        data.write(fname, format=fmt)
+    return data
+
+
 if __name__ == '__main__':
-    run_tutorial()
+    run_tutorial(use_cache="--no-cache" not in sys.argv)
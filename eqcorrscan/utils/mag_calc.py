@@ -219,7 +219,14 @@ def dist_calc(loc1, loc2):
 
     :returns: Distance between points in km.
     :rtype: float
+
+    .. note::
+        If either of loc1 or loc2 is an (N, 3) array the distances are
+        computed in one go by :func:`dist_calc_batch` and returned as an
+        array.
     """
+    if np.ndim(loc1) == 2 or np.ndim(loc2) == 2:
+        return dist_calc_batch(loc1, loc2)
     from eqcorrscan.utils.libnames import _load_cdll
     import ctypes
 
@@ -238,6 +245,50 @@ def dist_calc(loc1, loc2):
     return dist
 
 
+def dist_calc_batch(loc1, loc2):
+    """
+    Calculate the distances in km between many pairs of points.
+
+    Uses the same haversine and depth correction as :func:`dist_calc`, but
+    works on whole arrays of locations at once.
+
+    :type loc1: numpy.ndarray
+    :param loc1:
+        Array of shape (N, 3) of lat, lon, depth (in decimal degrees and km)
+    :type loc2: numpy.ndarray
+    :param loc2:
+        Array of shape (N, 3) of lat, lon, depth (in decimal degrees and km)
+
+    :returns: Distance between each pair of points in km.
+    :rtype: numpy.ndarray
+
+    .. note::
+        Either of loc1 or loc2 can be a single location, in which case
+        distances from that location to all of the others are returned.
+
+    .. rubric:: Example
+
+    >>> import numpy as np
+    >>> loc1 = np.array([[0, 0, 0], [45, 45, 0]])
+    >>> loc2 = np.array([[0, 1, 0], [45, 46, 0]])
+    >>> print(np.round(dist_calc_batch(loc1, loc2)).tolist())
+    [111.0, 79.0]
+    """
+    loc1 = np.asarray(loc1, dtype=np.float64).reshape(-1, 3)
+    loc2 = np.asarray(loc2, dtype=np.float64).reshape(-1, 3)
+    if len(loc1) != len(loc2) and 1 not in (len(loc1), len(loc2)):
+        raise ValueError(
+            "loc1 and loc2 have different lengths: {0} and {1}".format(
+                len(loc1), len(loc2)))
+    lat1, lon1 = np.deg2rad(loc1[:, 0]), np.deg2rad(loc1[:, 1])
+    lat2, lon2 = np.deg2rad(loc2[:, 0]), np.deg2rad(loc2[:, 1])
+    central_angle = 2 * np.arcsin(np.sqrt(
+        np.sin((lat1 - lat2) / 2) ** 2 +
+        np.cos(lat1) * np.cos(lat2) * np.sin((lon1 - lon2) / 2) ** 2))
+    distance = 6371.009 * central_angle
+    return np.sqrt(distance ** 2 + (loc1[:, 2] - loc2[:, 2]) ** 2)
+
+
 def _sim_WA(trace, inventory, water_level, velocity=False):
     """
     Remove the instrument response from a trace and simulate a Wood-Anderson.